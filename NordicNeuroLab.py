@@ -1,13 +1,59 @@
 from serial import Serial, SerialException
-import time
 import sys
 import glob
+import itertools
+import os
+import select
+import time
+from typing import Iterator, Optional
+
+_RESPONSE_TIMEOUT = 0.5 #Seconds to wait for the SyncBox to answer a command
+_CHUNK_TIMEOUT = 0.05 #Seconds of silence after which a partial configuration reply is considered failed
+_POSIX = os.name == 'posix' #Triggers are read directly from the file descriptor on POSIX
+_WIN_PORTS = tuple(f"COM{i}" for i in range(1, 257))
+_LAST_PORT_FILE = os.path.expanduser("~/.py_syncbox_port") #Port the SyncBox was last found on
+
+
+def _make_enumerator():
+    """
+    This function picks the serial port enumerator for the current OS once, at import time.
+
+    Return
+    -------
+    function
+        A generator function yielding candidate serial ports
+    """
+    def _win_ports():
+        yield from _WIN_PORTS
+
+    def _linux_ports():
+        yield from glob.iglob('/dev/ttyUSB*')
+        yield from glob.iglob('/dev/ttyACM*')
+        yield from glob.iglob('/dev/ttyS*')
+
+    def _darwin_ports():
+        yield from glob.iglob('/dev/tty.usbserial*')
+        yield from glob.iglob('/dev/tty.usbmodem*')
+
+    def _unsupported_ports():
+        raise EnvironmentError('Unsupported platform')
+
+    if sys.platform.startswith('win'):
+        return _win_ports
+    elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
+        return _linux_ports
+    elif sys.platform.startswith('darwin'):
+        return _darwin_ports
+    return _unsupported_ports
+
+_PORT_ENUMERATOR = _make_enumerator()
+
 
 class SyncBox:
 
     
     def __init__(self, num_volumes=16, num_slices=1, trigger_slice=1, trigger_volume=1, pulse_length=100, 
-    TR_time=3000, optional_trigger_slice=0, optional_trigger_volume=0, simulation = True):
+    TR_time=3000, optional_trigger_slice=0, optional_trigger_volume=0, simulation = True, port = None):
         """
         This class finds and establishes serial connection with the SyncBox in serial mode.
 
@@ -31,6 +77,9 @@ class SyncBox:
             0 for triggering on each volume typed above. 1 for triggering on each volume. 2 for triggering on random volume. (1 and 2 override above settings)
         simulation
             False for synchronization mode. True for simulation mode.
+        port
+            Serial port the SyncBox is expected on, e.g. "COM3" or "/dev/ttyUSB0".
+            All serial ports are searched if it is not found there.
         """
         
         self.num_volumes = num_volumes
@@ -43,7 +92,10 @@ class SyncBox:
         self.optional_trigger_volume = optional_trigger_volume
         self.simulation = simulation
 
-        self.port = self._findSyncBox()
+        self.port = self._findSyncBox(port)
+        self.port.timeout = _RESPONSE_TIMEOUT
+        self._current_timeout = _RESPONSE_TIMEOUT
+        self._setLowLatency()
         self._configure()
     
 
@@ -62,8 +114,11 @@ class SyncBox:
             "d" for right thumb on ResponseGrips
         
         """
-        out = self.port.read(self.port.in_waiting)
-        return out.decode("utf-8")
+        waiting = self.port.in_waiting
+        if not waiting:
+            return ""
+        out = self.port.read(waiting)
+        return out.decode("latin-1")
         
 
 
@@ -87,10 +142,75 @@ class SyncBox:
             "d" for right thumb on ResponseGrips
         
         """
-        self.port.timeout = timeout
-        out = self.port.read(1)
-        self.port.timeout = None
-        return out.decode("utf-8")
+        return self.getTriggerBytes(timeout).decode("latin-1")
+
+    def getTriggerBytes(self, timeout = 0) -> bytes:
+        """
+        This function returns the trigger sent from the SyncBox to the computer without decoding it.
+        Preferred in tight polling loops, compare against bytes, e.g. trigger == b"s".
+        
+        Parameters
+        ----------
+        timeout : float
+            Number of seconds to wait for the trigger to be returned from SyncBox
+            if set to None, it will wait an unlimited number of seconds for input.
+
+        Return
+        ------
+        trigger : bytes
+            b"s", b"a", b"b", b"c" or b"d", see getTrigger for their meaning.
+            b"" if no trigger was received before the timeout.
+
+        Raises
+        ----------
+        SerialException
+            if the serial port can no longer be read, e.g. the SyncBox was disconnected
+        
+        """
+        if _POSIX:
+            fd = self.port.fileno()
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+                ready, _, _ = select.select([fd], [], [], remaining)
+                if not ready:
+                    return b""
+                try:
+                    out = os.read(fd, 1)
+                    break
+                except BlockingIOError:
+                    continue  #The byte was taken before we could read it, keep waiting
+                except OSError as e:
+                    raise SerialException(f"read failed: {e}")
+            if not out:
+                #A hung up tty stays readable but returns no data, e.g. when the SyncBox is unplugged
+                raise SerialException("device reports readiness to read but returned no data (device disconnected or multiple access on port?)")
+            return out
+        self._setTimeout(timeout)
+        return self.port.read(1)
+
+    def getTriggerBatch(self, n, timeout = None) -> str:
+        """
+        This function returns up to n triggers sent from the SyncBox to the computer in a single read.
+        
+        Parameters
+        ----------
+        n : int
+            Number of triggers to read
+        timeout : float
+            Number of seconds to wait for all n triggers to be returned from SyncBox
+            if set to None, it will wait until n triggers have been received.
+
+        Return
+        ------
+        triggers : str
+            The received triggers in order of arrival, see getTrigger for their meaning.
+            Shorter than n if the timeout expired.
+        
+        """
+        self._setTimeout(timeout)
+        out = self.port.read(n)
+        return out.decode("latin-1")
     
     def start(self) -> None:
         """
@@ -102,10 +222,9 @@ class SyncBox:
             if unable to start session
 
         """
+        self._setTimeout(_RESPONSE_TIMEOUT)
         self.port.write(b"S")
-        time.sleep(0.1)
         confirmation = self.port.read(1)
-        time.sleep(0.1)
         if confirmation != b"S":
             raise SyncBoxException(f"Unable to start session {confirmation}")
 
@@ -119,17 +238,22 @@ class SyncBox:
             if unable to stop session
 
         """
+        self._setTimeout(_RESPONSE_TIMEOUT)
         self.port.write(b"A")
-        time.sleep(0.1)
         confirmation = self.port.read(1)
-        time.sleep(0.1)
         if confirmation != b"A":
             raise SyncBoxException("Unable to stop session")
 
 
-    def _findSyncBox(self) -> Serial:
+    def _findSyncBox(self, hint=None) -> Serial:
         """
-        This function loops thorugh all available serialports and finds the SyncBox
+        This function loops thorugh all available serialports and finds the SyncBox.
+        The provided hint and the port the SyncBox was last found on are tried first.
+
+        Parameters
+        ----------
+        hint : str
+            Serial port to try before any other, or None
         
         Return
         -------
@@ -142,28 +266,102 @@ class SyncBox:
             if unable to find the SyncBox
         
         """
+        tried = set()
+        lastPort = self._readLastPort()
         availablePorts = self._getAvailableSerialPorts()
-        for port in availablePorts:
-            try:
-                com = Serial(port=port, baudrate=57600)
-                com.timeout = 0.2
-                com.write(b"C")   #Trying to enter computer mode
-                time.sleep(0.1)
-                confirmation = com.read(1)
-                time.sleep(0.1)
-                if confirmation == b"C":
-                    return com
-                    breakt
-
-            except SerialException:
+        for port in itertools.chain((hint, lastPort), availablePorts):
+            if port is None or port in tried:
                 continue
-     
+            tried.add(port)
+            com = self._probePort(port)
+            if com is not None:
+                if port != lastPort:
+                    self._saveLastPort(port)
+                return com
 
         raise SyncBoxException("Unable to find SyncBox")
+
+
+    def _probePort(self, port) -> Optional[Serial]:
+        """
+        This function tries to put a SyncBox on the given serial port in computer mode
+
+        Return
+        -------
+        serialport : Serial
+            the opened serial port if the SyncBox answered, otherwise None
+
+        """
+        try:
+            com = Serial(port=port, baudrate=57600, timeout=0.1, write_timeout=0.5)
+        except (OSError, SerialException):
+            return None
+        try:
+            com.write(b"C")   #Trying to enter computer mode
+            confirmation = com.read(1)
+        except (OSError, SerialException):
+            confirmation = None
+        if confirmation == b"C":
+            return com
+        com.close()
+        return None
+
+
+    def _readLastPort(self) -> Optional[str]:
+        """
+        This function returns the serial port the SyncBox was last found on, or None if unknown
+
+        """
+        try:
+            with open(_LAST_PORT_FILE) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+
+    def _saveLastPort(self, port) -> None:
+        """
+        This function remembers the serial port the SyncBox was found on for the next connection
+
+        """
+        try:
+            with open(_LAST_PORT_FILE, "w") as f:
+                f.write(port)
+        except OSError:
+            pass
             
     
 
 
+    def _setTimeout(self, timeout) -> None:
+        """
+        This function sets the read timeout of the serial port, skipping the 
+        port reconfiguration when the timeout is already set.
+
+        Parameters
+        ----------
+        timeout : float
+            Number of seconds to wait for input, None to wait forever.
+
+        """
+        if timeout != self._current_timeout:
+            self.port.timeout = timeout
+            self._current_timeout = timeout
+
+
+    def _setLowLatency(self) -> None:
+        """
+        This function asks the serial driver to deliver incoming bytes immediately (ASYNC_LOW_LATENCY)
+        instead of batching them, which removes up to 16 ms of trigger latency on USB-serial adapters.
+        Only supported on Linux, on other platforms or drivers the port is left unchanged.
+
+        """
+        try:
+            self.port.set_low_latency_mode(True)
+        except (ValueError, AttributeError, NotImplementedError):
+            pass
+
+
     def _configure(self) -> None:
         """
         This function configures the SyncBox to the parameters provided to the constructor
@@ -174,32 +372,33 @@ class SyncBox:
             if incorrect confirmation is recieved from SyncBox
 
         """
+        self._setTimeout(_RESPONSE_TIMEOUT)
         self.port.write(b"R")   #Entering SyncBox configuration mode
-        time.sleep(0.1)
         confirmation = self.port.read(1)
-        time.sleep(0.1)
         if confirmation != b"R":
             raise SyncBoxException(f"Unable to configure SyncBox. Please restart the SyncBox")
-        self.port.write(b"0000") #Dummy "0000"
-        self.port.write(self._stringVar(self.num_volumes)) #Number of volumes "xxxx"
-        self.port.write(self._stringVar(self.num_slices)) #Number of slices in each volume "xxxx"
-        self.port.write(self._stringVar(self.pulse_length)) #Pulse length in ms (Only needed in simulation mode) "xxxx"
-        self.port.write(self._stringVar(self.TR_time)) #TR time in ms (Only needed in simulation mode) "xxxx"
-        self.port.write(self._stringVar(self.trigger_slice)) #Slice number you like to trigger on "xxxx"
-        self.port.write(self._stringVar(self.trigger_volume)) #Enter how often you will trigger on volume "xxxx"
-        self.port.write(b"0000") #Dummy "0000"
-        self.port.write(b"0000") #Dummy "0000"
-        self.port.write(self._stringVar(self.optional_trigger_slice)) #0 for triggering on each slice typed above, 1 for triggering on each slice, 2 for triggering on random slice "000x"
-        self.port.write(self._stringVar(self.optional_trigger_volume)) #0 for triggering on each volume typed above, 1 for triggering on each volume, 2 for triggering on random volume "000x"
-        if self.simulation:
-            self.port.write(b"0000") #0001 for synchronization 0000 for simualtion
-        else:
-            self.port.write(b"0001")
-        time.sleep(0.2)
-        confirmation = self.port.read(12*4)
-        time.sleep(0.1)
+        payload = (b"0000" #Dummy "0000"
+            + self._stringVar(self.num_volumes) #Number of volumes "xxxx"
+            + self._stringVar(self.num_slices) #Number of slices in each volume "xxxx"
+            + self._stringVar(self.pulse_length) #Pulse length in ms (Only needed in simulation mode) "xxxx"
+            + self._stringVar(self.TR_time) #TR time in ms (Only needed in simulation mode) "xxxx"
+            + self._stringVar(self.trigger_slice) #Slice number you like to trigger on "xxxx"
+            + self._stringVar(self.trigger_volume) #Enter how often you will trigger on volume "xxxx"
+            + b"0000" #Dummy "0000"
+            + b"0000" #Dummy "0000"
+            + self._stringVar(self.optional_trigger_slice) #0 for triggering on each slice typed above, 1 for triggering on each slice, 2 for triggering on random slice "000x"
+            + self._stringVar(self.optional_trigger_volume) #0 for triggering on each volume typed above, 1 for triggering on each volume, 2 for triggering on random volume "000x"
+            + (b"0000" if self.simulation else b"0001")) #0001 for synchronization 0000 for simualtion
+        self.port.write(payload)
+        confirmation = self.port.read(1)
+        self._setTimeout(_CHUNK_TIMEOUT)
+        while confirmation and len(confirmation) < 12*4:
+            chunk = self.port.read(12*4 - len(confirmation))
+            if not chunk:
+                break
+            confirmation += chunk
         if len(confirmation) != 12*4:
-            raise SyncBoxException(f"Unable to configure SyncBox. Please restart the SyncBox")
+            raise SyncBoxException(f"Unable to configure SyncBox, received {len(confirmation)}/{12*4} bytes. Please restart the SyncBox")
         
 
     def _stringVar(self, var) -> bytes:
@@ -215,63 +414,41 @@ class SyncBox:
         Raises
         ----------
         SyncBoxException
-            if a provided parameter is of incorrect length
-
-        """
-        num = str(var)
-        if len(num) == 1:
-            zero = "000"
-        elif len(num) == 2:
-            zero = "00"
-        elif len(num) == 3:
-            zero = "0"
-        elif len(num) == 4:
-            zero = ""
-        else:
+            if a provided parameter is not a whole number or of incorrect length
+
+        """
+        if isinstance(var, bool):
+            raise SyncBoxException(f"The parameter '{var}' is unsupported. Please use a number, not True or False")
+        try:
+            num = int(var)
+        except (TypeError, ValueError, OverflowError):
+            raise SyncBoxException(f"The parameter '{var}' is unsupported. Please check that your parameters are whole numbers") from None
+        if not isinstance(var, str) and num != var:
+            raise SyncBoxException(f"The parameter '{var}' is unsupported. Please check that your parameters have no decimals")
+        if not 0 <= num <= 9999:
             raise SyncBoxException(f"The parameter '{var}' is unsupported. Please check that your parameters is maximum 4 digits")
-        
-        string = zero + num
-        return bytes(string, 'ascii')
+        return b"%04d" % num
     
 
 
-    def _getAvailableSerialPorts(self) -> list:
+    def _getAvailableSerialPorts(self) -> Iterator[str]:
         """
-        This function finds every available serial port on the currently used OS.
+        This function lazily yields every candidate serial port on the currently used OS,
+        so discovery can stop as soon as the SyncBox is found.
+        Ports that cannot be opened are filtered out by _findSyncBox.
 
         Return
         -------
-        list
-            A list of available serial ports
+        Iterator[str]
+            An iterator over candidate serial ports
         
         Raises
         -------
 
         EnvirornmentError
             If operative system is not available
-        SerialExcpetion 
-            If serial is not available
-        """
-        if sys.platform.startswith('win'):
-            ports = ['COM%s' % (i + 1) for i in range(256)]
-        elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
-            ports = glob.glob('/dev/tty[A-Za-z]*')
-        elif sys.platform.startswith('darwin'):
-            ports = glob.glob('/dev/tty.*')
-        else:
-            raise EnvironmentError('Unsupported platform')
-
-        result = []
-
-        for port in ports:
-            try:
-                s = Serial(port)
-
-                s.close()
-                result.append(port)
-            except (OSError, SerialException):
-                pass
-        return result
+        """
+        yield from _PORT_ENUMERATOR()
     
 
     def close(self):
@@ -284,10 +461,9 @@ class SyncBox:
             if unable to turn off computer mode.
 
         """
-        self.port.write(b"D")  
-        time.sleep(0.1)
+        self._setTimeout(_RESPONSE_TIMEOUT)
+        self.port.write(b"D")
         confirmation = self.port.read(1)
-        time.sleep(0.1)
         if confirmation != b"D":
             raise SyncBoxException("Unable to disconnect from SyncBox. Please turn it off manually")
         self.port.close()